@@ -1,60 +1,236 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
+import numpy as np
 import yfinance as yf
-from streamlit_autorefresh import st_autorefresh
 from streamlit_searchbox import st_searchbox
 import requests
-from datetime import date
-from typing import List
-
-# --- 1. CONFIG & AUTO-REFRESH ---
-# Keeps market prices live by refreshing every 60 seconds
-st_autorefresh(interval=60000, key="pricerefresh")
+import threading
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+from pathlib import Path
+from typing import List, Tuple
 
+# --- 1. CONFIG ---
 st.set_page_config(page_title="Mum's Stock Dashboard", layout="wide")
 st.title("📈 Stock Portfolio & History")
 
 # --- 2. CLOUD DATABASE CONNECTION ---
 conn = st.connection("gsheets", type=GSheetsConnection)
 
+@st.cache_resource(show_spinner=False) # One keep-alive session so Yahoo calls skip the TLS handshake
+def _http():
+    s = requests.Session()
+    s.headers['User-Agent'] = 'Mozilla/5.0'
+    # Room for the company-name thread pool to keep its connections alive alongside search
+    s.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return s
+
+SHEET_COLUMNS = ["Date", "Ticker", "Type", "Qty", "Price", "Platform"]
+
 def load_data():
-    try:
-        # ttl=0 ensures we pull the absolute latest data from the sheet
-        return conn.read(ttl=0)
-    except Exception:
-        return pd.DataFrame(columns=["Date", "Ticker", "Type", "Qty", "Price", "Platform"])
+    # ttl=0 ensures we pull the absolute latest data from the sheet; read errors
+    # propagate so the cached wrapper never stores them as an empty sheet
+    df = conn.read(ttl=0)
+    # A blank sheet reads back with no columns at all, so fill in the expected schema
+    if df.empty:
+        return pd.DataFrame(columns=SHEET_COLUMNS)
+    return df.reindex(columns=SHEET_COLUMNS + [c for c in df.columns if c not in SHEET_COLUMNS])
+
+@st.cache_data(ttl=30, show_spinner=False) # Reuse the sheet across reruns; cleared whenever a trade is saved
+def load_data_cached():
+    df = load_data()
+    if df.empty:
+        return df
+    # Cast once per sheet read rather than on every rerun
+    df["Qty"] = pd.to_numeric(df["Qty"], errors='coerce')
+    df["Price"] = pd.to_numeric(df["Price"], errors='coerce')
+    df["Date"] = pd.to_datetime(df["Date"])
+    # Sorted once here so everything sliced from it is already in date order
+    df = df.sort_values("Date", kind="stable").reset_index(drop=True)
+    # Low-cardinality text columns compare and group much faster as categories
+    for col in ("Ticker", "Type", "Platform"):
+        df[col] = df[col].astype("category")
+    return df
+
+@st.cache_resource(show_spinner=False) # Start the first sheet read while the sidebar renders
+def _warm_sheet_cache():
+    def warm():
+        try:
+            load_data_cached()
+        except Exception:
+            pass # The page's own load reports the error
+    t = threading.Thread(target=warm, daemon=True)
+    t.start()
+    return t
 
-@st.cache_data(ttl="1d") # Cache company names to keep the app snappy
+_warm_sheet_cache()
+
+@st.cache_data(ttl="1d", show_spinner=False) # Names rarely change; only network errors skip the cache
 def get_company_name(ticker):
+    # The search endpoint returns the name in a tiny payload, unlike the full Ticker.info scrape
+    url = f"https://query2.finance.yahoo.com/v1/finance/search?q={ticker}&quotes_count=5"
+    res = _http().get(url, timeout=2)
+    res.raise_for_status()
+    for q in res.json().get('quotes', []):
+        if q.get('symbol') == ticker:
+            return q.get('longname') or q.get('shortname') or ticker
+    return ticker
+
+def get_company_name_or_ticker(ticker):
     try:
-        return yf.Ticker(ticker).info.get('longName', ticker)
-    except:
+        return get_company_name(ticker)
+    except Exception:
         return ticker
 
+def get_company_names(tickers):
+    # Look names up concurrently; cached tickers return straight from the cache
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        return dict(zip(tickers, ex.map(get_company_name_or_ticker, tickers)))
+
+@st.cache_data(ttl=30, show_spinner=False) # Shared by the sidebar and the batch fallback; misses raise
+def get_live_price(ticker):
+    return yf.Ticker(ticker).fast_info['last_price']
+
+def get_fast_price(ticker):
+    try:
+        return ticker, get_live_price(ticker)
+    except Exception:
+        return ticker, None
+
+@st.cache_data(ttl=55, show_spinner=False) # Prices only tick once a minute anyway
+def get_live_prices(tickers):
+    # One batched download for the whole portfolio instead of a round-trip per ticker
+    prices = {}
+    if not tickers:
+        return prices
+    try:
+        data = yf.download(list(tickers), period="1d", interval="1m", group_by="ticker",
+                           threads=True, progress=False)
+    except Exception:
+        data = None
+    for ticker in tickers:
+        try:
+            # Older yfinance returns flat columns when only one symbol is requested
+            frame = data[ticker] if isinstance(data.columns, pd.MultiIndex) else data
+            prices[ticker] = float(frame["Close"].dropna().iloc[-1])
+        except Exception:
+            pass
+
+    # Anything the batch missed is looked up in parallel rather than one by one
+    missing = [t for t in tickers if t not in prices]
+    if missing:
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            for ticker, price in ex.map(get_fast_price, missing):
+                if price:
+                    prices[ticker] = price
+    return prices
+
+def compute_positions(all_data) -> Tuple[pd.DataFrame, pd.DataFrame, float, float, float]:
+    # Signed/buy-only columns are built on the raw arrays, so a single groupby on
+    # Ticker yields net quantity and cost basis without any per-ticker filtering
+    is_buy = (all_data["Type"] == "Buy").to_numpy()
+    is_sell = (all_data["Type"] == "Sell").to_numpy()
+    qty = all_data["Qty"].to_numpy()
+    trades = all_data.assign(Signed=np.where(is_buy, qty, np.where(is_sell, -qty, 0.0)),
+                             BuyQty=np.where(is_buy, qty, 0.0),
+                             BuyCost=np.where(is_buy, qty * all_data["Price"].to_numpy(), 0.0))
+    agg = trades.groupby("Ticker", observed=True).agg(
+        net_qty=("Signed", "sum"), buy_qty=("BuyQty", "sum"), buy_cost=("BuyCost", "sum"))
+    net_qty = agg["net_qty"]
+    avg_buy = agg["buy_cost"] / agg["buy_qty"]
+
+    # Realized Calculations
+    sells = all_data[all_data["Type"] == "Sell"].dropna(subset=["Ticker"])
+    realized_df = sells[["Date", "Ticker"]].assign(
+        Profit=(sells["Price"] - sells["Ticker"].map(avg_buy).astype(float)) * sells["Qty"])
+    total_realized_profit = realized_df["Profit"].sum()
+
+    # Unrealized (Active) Positions
+    held = net_qty[net_qty > 0]
+    avg_cost = avg_buy[held.index]
+    # Prices and company names come from different endpoints, so fetch both at once;
+    # live prices arrive in a single batch and fall back to cost if Yahoo has nothing
+    symbols = tuple(sorted(held.index))
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        prices_job = ex.submit(get_live_prices, symbols)
+        names_job = ex.submit(get_company_names, list(symbols))
+    price_map, company_map = prices_job.result(), names_job.result()
+    live_price = held.index.to_series().map(price_map).astype(float).fillna(avg_cost)
+
+    # Every series shares held's index, so the maths can run on the raw arrays
+    nq, lp, ac = held.to_numpy(), live_price.to_numpy(), avg_cost.to_numpy()
+    total_market_val = float(np.vdot(nq, lp))
+    total_unrealized_pnl = float(np.vdot(nq, lp - ac))
+
+    active_df = pd.DataFrame({"Ticker": held.index, "Company": held.index.map(company_map),
+                              "Shares": nq, "Avg Cost": ac, "Live": lp,
+                              "Value": nq * lp, "P/L": nq * (lp - ac)})
+
+    return active_df, realized_df, total_market_val, total_unrealized_pnl, total_realized_profit
+
 # --- 3. SEARCH & AUTO-PRICE LOGIC ---
 def search_stocks(search_term: str) -> List[str]:
-    if not search_term or len(search_term) < 2:
+    if not search_term or len(search_term.strip()) < 2:
         return []
-    url = f"https://query2.finance.yahoo.com/v1/finance/search?q={search_term}&quotes_count=5"
     try:
-        res = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}).json()
-        return [f"{q['symbol']} ({q.get('longname', 'Unknown')})" for q in res.get('quotes', [])]
+        # Normalise before hitting the cache so "aapl", "AAPL " and "AAPL" share one lookup
+        return search_yahoo(search_term.strip().lower())
     except Exception:
         return []
 
+# Search results also persist on disk for a week so a restarted server doesn't start cold
+SEARCH_CACHE_DIR = Path(__file__).parent / "cache"
+SEARCH_CACHE_TTL = 7 * 86400
+SEARCH_CACHE_MAX = 512
+
+def prune_search_cache():
+    # Drop expired files, then the oldest beyond the cap, so the directory stays bounded
+    files = sorted(SEARCH_CACHE_DIR.glob("search_*.json"), key=lambda f: f.stat().st_mtime, reverse=True)
+    now = time.time()
+    for i, f in enumerate(files):
+        if i >= SEARCH_CACHE_MAX or now - f.stat().st_mtime > SEARCH_CACHE_TTL:
+            f.unlink(missing_ok=True)
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False) # Repeat keystrokes within the hour stay offline
+def search_yahoo(search_term: str) -> List[str]:
+    path = SEARCH_CACHE_DIR / f"search_{hashlib.md5(search_term.encode()).hexdigest()}.json"
+    try:
+        cached = json.loads(path.read_text())
+        if time.time() - cached['ts'] < SEARCH_CACHE_TTL:
+            return cached['data']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    url = f"https://query2.finance.yahoo.com/v1/finance/search?q={search_term}&quotes_count=5"
+    res = _http().get(url, timeout=2)
+    res.raise_for_status()
+    results = [f"{q['symbol']} ({q.get('longname', 'Unknown')})" for q in res.json().get('quotes', [])]
+    if results:
+        try:
+            SEARCH_CACHE_DIR.mkdir(exist_ok=True)
+            path.write_text(json.dumps({'ts': time.time(), 'data': results}))
+            prune_search_cache()
+        except OSError:
+            pass
+    return results
+
 # --- 4. SIDEBAR: INTUITIVE ENTRY ---
 with st.sidebar:
     st.header("➕ Add New Trade")
     
     # STEP 1: Search (Live/Outside form)
-    selected_result = st_searchbox(search_stocks, key="ticker_search", label="1. Search Stock")
+    selected_result = st_searchbox(search_stocks, key="ticker_search", label="1. Search Stock", debounce=300)
     
     suggested_price = 0.0
     if selected_result:
         ticker_symbol = selected_result.split(" ")[0]
         try:
-            suggested_price = yf.Ticker(ticker_symbol).fast_info['last_price']
+            suggested_price = get_live_price(ticker_symbol)
         except:
             suggested_price = 0.0
 
@@ -75,11 +251,14 @@ with st.sidebar:
 
 if submitted and selected_result:
     ticker = selected_result.split(" ")[0]
-    df = load_data()
-    new_entry = pd.DataFrame([{"Date": str(t_date), "Ticker": ticker, "Type": t_type, 
-                               "Qty": t_qty, "Price": t_price, "Platform": t_platform}])
-    updated_df = pd.concat([df, new_entry], ignore_index=True)
-    conn.update(data=updated_df)
+    # Append just the new row instead of reading and rewriting the whole sheet
+    worksheet = conn.client._select_worksheet()
+    rows = [[str(t_date), ticker, t_type, t_qty, t_price, t_platform]]
+    if not worksheet.row_values(1):
+        # A fresh sheet needs its header first, or the first trade would be read back as one
+        rows.insert(0, SHEET_COLUMNS)
+    worksheet.append_rows(rows, value_input_option="USER_ENTERED")
+    load_data_cached.clear()
     st.sidebar.success(f"Added {ticker}!")
     st.rerun()
 
@@ -87,50 +266,35 @@ if submitted and selected_result:
 # Creating tabs to separate the Live Dashboard from the Full History
 tab1, tab2 = st.tabs(["📊 Live Dashboard", "📜 Transaction History"])
 
-all_data = load_data()
+def color_pnl(col):
+    # Styles the whole P/L column in one vectorised call rather than cell by cell
+    return np.where(col > 0, 'color: green', 'color: red')
 
-with tab1:
+def refresh_interval():
+    # Every exchange is shut from Friday evening to Sunday afternoon New York time, so poll
+    # slowly then; on weekdays some market with an open position may still be trading
+    now = datetime.now(ZoneInfo("America/New_York"))
+    weekend = ((now.weekday() == 4 and now.hour >= 20) or now.weekday() == 5
+               or (now.weekday() == 6 and now.hour < 17))
+    return 15 * 60 if weekend else 60
+
+REFRESH_INTERVAL = refresh_interval()
+
+# Only the dashboard re-runs on the refresh tick to keep market prices live;
+# the sidebar form and history tab are left alone between ticks
+@st.fragment(run_every=REFRESH_INTERVAL)
+def live_dashboard():
+    if refresh_interval() != REFRESH_INTERVAL:
+        # Markets opened or closed since the page was built; rebuild it with the new interval
+        st.rerun()
+    try:
+        all_data = load_data_cached()
+    except Exception:
+        st.warning("Couldn't reach the Google Sheet just now, retrying on the next refresh.")
+        return
     if not all_data.empty:
-        # Convert numeric types
-        all_data["Qty"] = pd.to_numeric(all_data["Qty"], errors='coerce')
-        all_data["Price"] = pd.to_numeric(all_data["Price"], errors='coerce')
-        all_data["Date"] = pd.to_datetime(all_data["Date"])
-
-        active_positions = []
-        realized_trades = []
-        total_market_val, total_unrealized_pnl, total_realized_profit = 0.0, 0.0, 0.0
-
-        for ticker in all_data['Ticker'].unique():
-            t_df = all_data[all_data['Ticker'] == ticker]
-            buys = t_df[t_df['Type'] == 'Buy']
-            sells = t_df[t_df['Type'] == 'Sell']
-            net_qty = buys['Qty'].sum() - sells['Qty'].sum()
-            
-            # Realized Calculations
-            if not sells.empty:
-                avg_buy_price = (buys['Qty'] * buys['Price']).sum() / buys['Qty'].sum()
-                for _, sell_row in sells.iterrows():
-                    profit = (sell_row['Price'] - avg_buy_price) * sell_row['Qty']
-                    total_realized_profit += profit
-                    realized_trades.append({"Date": sell_row['Date'], "Ticker": ticker, "Profit": profit})
-
-            # Unrealized (Active) Positions
-            if net_qty > 0:
-                avg_cost = (buys['Qty'] * buys['Price']).sum() / buys['Qty'].sum()
-                try:
-                    live_price = yf.Ticker(ticker).fast_info['last_price']
-                except:
-                    live_price = avg_cost
-                
-                cur_val = net_qty * live_price
-                un_pnl = cur_val - (net_qty * avg_cost)
-                total_market_val += cur_val
-                total_unrealized_pnl += un_pnl
-
-                active_positions.append({
-                    "Ticker": ticker, "Company": get_company_name(ticker), "Shares": net_qty,
-                    "Avg Cost": avg_cost, "Live": live_price, "Value": cur_val, "P/L": un_pnl
-                })
+        active_df, realized_df, total_market_val, total_unrealized_pnl, total_realized_profit = \
+            compute_positions(all_data)
 
         # Metrics display
         m1, m2, m3 = st.columns(3)
@@ -140,24 +304,32 @@ with tab1:
 
         # Active Positions Table
         st.subheader("📋 Active Positions")
-        if active_positions:
-            active_df = pd.DataFrame(active_positions)
-            st.table(active_df.style.applymap(lambda x: 'color: green' if x > 0 else 'color: red', subset=['P/L'])
+        if not active_df.empty:
+            st.table(active_df.style.apply(color_pnl, subset=['P/L'])
                      .format({"Avg Cost": "${:.2f}", "Live": "${:.2f}", "Value": "${:,.2f}", "P/L": "${:,.2f}"}))
-        
+
         # Cumulative Chart
-        if realized_trades:
+        if not realized_df.empty:
             st.subheader("💰 Realized Profit Over Time")
-            chart_df = pd.DataFrame(realized_trades).sort_values("Date")
-            chart_df["Cumulative Profit"] = chart_df["Profit"].cumsum()
+            chart_df = realized_df.assign(**{"Cumulative Profit": realized_df["Profit"].cumsum()})
             st.area_chart(data=chart_df, x="Date", y="Cumulative Profit")
     else:
         st.info("The sidebar is ready! Add your first trade to get started.")
 
+try:
+    all_data = load_data_cached()
+except Exception:
+    all_data = None
+
+with tab1:
+    live_dashboard()
+
 with tab2:
     st.subheader("📜 Full History")
-    if not all_data.empty:
+    if all_data is None:
+        st.warning("Couldn't reach the Google Sheet just now. Reload the page to try again.")
+    elif not all_data.empty:
         # Displaying the raw CSV/Sheet data so she can audit her entries
-        st.dataframe(all_data.sort_values("Date", ascending=False), use_container_width=True)
+        st.dataframe(all_data.iloc[::-1], use_container_width=True)
     else:
         st.write("No transactions recorded yet.")
\ No newline at end of file